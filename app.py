@@ -1,12 +1,26 @@
 import streamlit as st
 import tempfile
 import os
+import hashlib
+import shutil
 from pymavlink import mavutil
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from concurrent.futures import Future, ThreadPoolExecutor
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from fpdf import FPDF
 from io import BytesIO
-from typing import Dict, List, Tuple, Any
+from operator import attrgetter, itemgetter
+from typing import BinaryIO, Callable, Dict, List, Tuple, Any
+
+# Long flight traces: stroke Agg paths in chunks and merge segments closer than a pixel
+matplotlib.rcParams["agg.path.chunksize"] = 10000
+matplotlib.rcParams["path.simplify"] = True
+matplotlib.rcParams["path.simplify_threshold"] = 1.0
 
 # -----------------------------
 # Constants and mappings
@@ -42,6 +56,75 @@ EV_ID_MAP = {
     62: "EKF failsafe triggered",
 }
 
+# Fields read from each message type (column order of the resulting frames)
+RCIN_CHANNELS = ("C1", "C2", "C3", "C4")
+BATTERY_FIELDS = ("Volt", "VoltR", "Curr", "CurrTot", "Temp", "RemPct")
+# Battery identity, most specific first: instance on current firmware, SNum on older logs
+BATTERY_PACK_FIELDS = ("Inst", "Instance", "SNum")
+RCOU_CHANNELS = tuple(f"C{i}" for i in range(1, 17))
+LOG_FIELDS = {
+    "ERR": ("Subsys", "ECode"),
+    "EV": ("Id",),
+    "GPS": ("Alt",),
+    "BAT": BATTERY_FIELDS + BATTERY_PACK_FIELDS,
+    "ATT": ("DesRoll", "Roll"),
+    "ESC": ("Temp",),
+    "VIBE": ("VibeX", "VibeY", "VibeZ"),
+    "RCIN": RCIN_CHANNELS,
+    "RCOU": RCOU_CHANNELS,
+}
+
+# DataFlash format characters -> numpy field dtypes, mirroring pymavlink's FORMAT_TO_STRUCT
+# (records are little-endian, unpadded; "a" is 64 bytes read as 32 int16 values)
+DF_FORMAT_DTYPES = {
+    "a": ("<i2", (32,)),
+    "b": "i1",
+    "B": "u1",
+    "g": "<f2",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "f": "<f4",
+    "n": "S4",
+    "N": "S16",
+    "Z": "S64",
+    "c": "<i2",
+    "C": "<u2",
+    "e": "<i4",
+    "E": "<u4",
+    "L": "<i4",
+    "d": "<f8",
+    "M": "i1",
+    "q": "<i8",
+    "Q": "<u8",
+}
+
+# Message types consumed by the app; everything else is skipped by the reader
+LOG_MESSAGE_TYPES = set(LOG_FIELDS)
+
+# Column layout (name -> dtype) of the per-pack battery accumulators, before the pack field
+BATTERY_COLUMNS = {
+    "TimeUS": np.int64,
+    "Volt": np.float32,
+    "VoltR": np.float32,
+    "Curr": np.float32,
+    "CurrTot": np.float32,
+    "Temp": np.float32,
+    "RemPct": np.float32,
+}
+
+# Values used by the streamed reader for fields a log's format does not carry (else NaN)
+FIELD_DEFAULTS = {"Subsys": -1, "ECode": -1, "Id": -1, "SNum": 0}
+
+NAN = float("nan")
+
+# Logs whose parsed data and rendered charts stay cached (oldest evicted first)
+LOG_CACHE_ENTRIES = 4
+
+# Output resolution of chart PNGs (shown scaled to the page width)
+CHART_DPI = 200
+
 # -----------------------------
 # Page config & header
 # -----------------------------
@@ -57,147 +140,369 @@ Upload your ArduPilot `.BIN` log file for analysis. This tool helps assess fligh
 # Helpers
 # -----------------------------
 
-def _safe_time_s(msg: Any) -> float | None:
-    """Return message time in seconds if available, else None."""
+def _safe_time_us(msg: Any) -> int | None:
+    """Return message time in microseconds if available, else None."""
     timeus = getattr(msg, "TimeUS", None)
     if timeus is not None:
-        return round(timeus / 1e6, 2)
+        return timeus
     time_s = getattr(msg, "TimeS", None)
     if time_s is not None:
         try:
-            return float(time_s)
+            return int(float(time_s) * 1e6)
         except Exception:
             return None
     return None
 
 
-@st.cache_data(show_spinner=False)
-def parse_log(file_bytes: bytes) -> Dict[str, Any]:
-    """Parse a BIN log (bytes) and return structured data for the app."""
-    # Temp file for pymavlink
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".bin") as tf:
-        tf.write(file_bytes)
-        temp_filename = tf.name
+class ColBuf:
+    """Typed numpy columns filled one row at a time, doubling on overflow."""
+
+    def __init__(self, spec: Dict[str, Any], capacity: int = 4096):
+        self.names = list(spec)
+        self._cols = [np.empty(capacity, dtype=dtype) for dtype in spec.values()]
+        self._n = 0
+
+    def push(self, *values: Any) -> None:
+        """Append one row; values are given in column order."""
+        n = self._n
+        if n == len(self._cols[0]):
+            self._grow()
+        for col, value in zip(self._cols, values):
+            col[n] = value
+        self._n = n + 1
+
+    def _grow(self) -> None:
+        grown = []
+        for col in self._cols:
+            new = np.empty(2 * len(col), dtype=col.dtype)
+            new[: self._n] = col[: self._n]
+            grown.append(new)
+        self._cols = grown
+
+    def to_frame(self) -> pd.DataFrame:
+        """Wrap the filled part of each column in a DataFrame without copying."""
+        n = self._n
+        return pd.DataFrame({name: col[:n] for name, col in zip(self.names, self._cols)}, copy=False)
+
+
+def _present(msg: Any, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Return the subset of `fields` that the message format actually carries."""
+    available = set(msg.get_fieldnames())
+    return tuple(f for f in fields if f in available)
+
+
+def _record_dtype(fmt: Any) -> np.dtype | None:
+    """numpy layout of one DataFlash record (3-byte header + payload), or None if unsupported."""
+    try:
+        dtype = np.dtype(
+            {
+                "names": ["_head", *fmt.columns],
+                "formats": ["V3", *[DF_FORMAT_DTYPES[c] for c in fmt.format]],
+            }
+        )
+    except (KeyError, ValueError):
+        return None
+    return dtype if dtype.itemsize == fmt.len else None
+
+
+def _records_frame(records: np.ndarray, fmt: Any) -> pd.DataFrame:
+    """Time plus the wanted fields of one message type, scaled the way pymavlink scales them."""
+    if "TimeUS" in fmt.columns:
+        cols: Dict[str, Any] = {"TimeUS": records["TimeUS"].astype(np.int64)}
+    elif "TimeS" in fmt.columns:
+        cols = {"TimeUS": (records["TimeS"] * 1e6).astype(np.int64)}
+    else:
+        return pd.DataFrame()
+    for name in LOG_FIELDS[fmt.name]:
+        if name not in fmt.columns:
+            continue
+        values = records[name]
+        mult = fmt.msg_mults[fmt.columns.index(name)]
+        if mult is not None:
+            # pymavlink divides for sub-unit multipliers (better float accuracy); match it
+            values = values / (1.0 / mult) if 0.0 < mult < 1.0 else values * mult
+        cols[name] = values
+    return pd.DataFrame(cols)
+
+
+def _split_packs(bat: pd.DataFrame) -> Dict[int, pd.DataFrame]:
+    """Split BAT samples per battery, keyed by the first pack field present (else pack 0)."""
+    if bat.empty:
+        return {}
+    pack_field = next((f for f in BATTERY_PACK_FIELDS if f in bat.columns), None)
+    if pack_field is None:
+        return {0: bat}
+    return {int(pack): group.reset_index(drop=True) for pack, group in bat.groupby(pack_field)}
+
+
+def _read_indexed(mlog: Any) -> Dict[str, Any] | None:
+    """Read the wanted message types as numpy record arrays straight from the log buffer.
+
+    DFReader_binary already frames the whole file into per-type record offsets when it
+    opens it; gathering those records into structured arrays avoids creating a Python
+    message object per record. Returns None when the reader does not expose that index.
+    Output has the same shape as _read_streamed().
+    """
+    offsets = getattr(mlog, "offsets", None)
+    formats = getattr(mlog, "formats", None)
+    data_map = getattr(mlog, "data_map", None)
+    if offsets is None or formats is None or data_map is None:
+        return None
+
+    data = np.frombuffer(data_map, dtype=np.uint8)
+    frames: Dict[str, Any] = {}
+    for type_id, fmt in formats.items():
+        if fmt.name not in LOG_FIELDS or not offsets[type_id]:
+            continue
+        dtype = _record_dtype(fmt)
+        if dtype is None:
+            return None
+        ofs = np.asarray(offsets[type_id], dtype=np.int64)
+        ofs = ofs[ofs + fmt.len <= len(data)]  # drop a truncated final record
+        windows = np.lib.stride_tricks.sliding_window_view(data, fmt.len)
+        records = windows[ofs].view(dtype)[:, 0]
+        frames[fmt.name] = _records_frame(records, fmt)
+    frames["BAT"] = _split_packs(frames.get("BAT", pd.DataFrame()))
+    return frames
+
+
+def _index_truncated(mlog: Any) -> bool:
+    """True when pymavlink's offset index stopped well short of the end of the log.
+
+    DFReader_binary stops indexing at the first record header with an undefined type
+    id, so typed reads (recv_match with a type filter, _read_indexed) silently miss
+    everything after it. Up to 528 bytes of trailing garbage is normal, as in pymavlink.
+    """
+    offsets = getattr(mlog, "offsets", None)
+    formats = getattr(mlog, "formats", None)
+    data_len = getattr(mlog, "data_len", None)
+    if offsets is None or formats is None or data_len is None:
+        return False
+    end = max((offsets[type_id][-1] + fmt.len for type_id, fmt in formats.items() if offsets[type_id]), default=0)
+    return data_len - end > 528
+
+
+def _field_getter(msg: Any, fields: Tuple[str, ...]) -> Callable[[Any], Tuple[Any, ...]]:
+    """Build a reader returning `fields` as a tuple for messages with `msg`'s format.
+
+    Resolved once per message type; fields the format lacks read as their FIELD_DEFAULTS
+    entry (NaN unless listed).
+    """
+    present = set(_present(msg, fields))
+    if len(fields) > 1 and len(present) == len(fields):
+        return attrgetter(*fields)
+    getters = [attrgetter(f) if f in present else None for f in fields]
+    defaults = [FIELD_DEFAULTS.get(f, NAN) for f in fields]
+    return lambda m: tuple(d if g is None else g(m) for g, d in zip(getters, defaults))
+
+
+def _channel_getter(msg: Any, channels: Tuple[str, ...]) -> Callable[[Any], Tuple[Any, ...]] | None:
+    """Read PWM channels straight from the unpacked record (DFMessage._elements).
+
+    Channels are plain integers without a multiplier, so the stored values are what
+    getattr() would return; one itemgetter call replaces a __getattr__ per channel.
+    Returns None when the message does not expose its record that way.
+    """
+    fmt = getattr(msg, "fmt", None)
+    if fmt is None or not hasattr(msg, "_elements") or len(channels) < 2:
+        return None
+    idx = [fmt.columns.index(c) for c in channels]
+    if any(fmt.msg_mults[i] is not None for i in idx):
+        return None
+    pick = itemgetter(*idx)
+    return lambda m: pick(m._elements)
+
 
-    error_msgs: List[str] = []
-    event_msgs: List[str] = []
-    altitude_data: List[Dict[str, Any]] = []
-    battery_by_pack: Dict[int, List[Dict[str, Any]]] = {}
-    attitude_data: List[Dict[str, Any]] = []
-    esc_data: List[Dict[str, Any]] = []
-    vibe_data: List[Dict[str, Any]] = []
-    rc_data: List[Dict[str, Any]] = []
-    rcout_data: List[Dict[str, Any]] = []
+def _read_streamed(mlog: Any, types: set | None = LOG_MESSAGE_TYPES) -> Dict[str, Any]:
+    """Read the wanted message types one pymavlink message at a time.
+
+    `types=None` reads every message unfiltered, which resynchronises past corrupt
+    records the offset index stopped at; other types are dropped as they arrive.
+    Returns one frame per type, except "BAT", which maps battery pack -> frame.
+    """
+    bufs = {
+        "ERR": ColBuf({"TimeUS": np.int64, "Subsys": np.int32, "ECode": np.int32}),
+        "EV": ColBuf({"TimeUS": np.int64, "Id": np.int32}),
+        "GPS": ColBuf({"TimeUS": np.int64, "Alt": np.float32}),
+        "ATT": ColBuf({"TimeUS": np.int64, "DesRoll": np.float32, "Roll": np.float32}),
+        "ESC": ColBuf({"TimeUS": np.int64, "Temp": np.float32}),
+        "VIBE": ColBuf({"TimeUS": np.int64, "VibeX": np.float32, "VibeY": np.float32, "VibeZ": np.float32}),
+    }
+    packs: Dict[int, ColBuf] = {}
+
+    def make_handler(msg: Any) -> Callable[[Any, int], None]:
+        """Bind the field getter and target buffer for the type of `msg` (its first sample)."""
+        msg_type = msg.get_type()
+        if msg_type not in LOG_FIELDS:
+            return lambda m, t: None
+        if msg_type == "BAT":
+            # Route on the first pack field the log carries (read as 0 if it has none)
+            pack_field = (_present(msg, BATTERY_PACK_FIELDS) or ("SNum",))[0]
+            bat_columns = {**BATTERY_COLUMNS, pack_field: np.int32}
+
+            def handle_bat(m: Any, t: int, get=_field_getter(msg, BATTERY_FIELDS + (pack_field,))) -> None:
+                values = get(m)
+                pack = int(values[-1])
+                buf = packs.get(pack)
+                if buf is None:
+                    buf = packs[pack] = ColBuf(bat_columns)
+                buf.push(t, *values)
+
+            return handle_bat
+
+        fields = LOG_FIELDS[msg_type]
+        get = None
+        if msg_type not in bufs:
+            # PWM buffers are created on the first sample, with only the channels the log carries
+            fields = _present(msg, fields)
+            bufs[msg_type] = ColBuf({"TimeUS": np.int64, **dict.fromkeys(fields, np.int32)})
+            get = _channel_getter(msg, fields)
+        if get is None:
+            get = _field_getter(msg, fields)
+
+        def handle(m: Any, t: int, get=get, push=bufs[msg_type].push) -> None:
+            push(t, *get(m))
+
+        return handle
+
+    # Message type -> handler, filled in as each type is first seen
+    handlers: Dict[str, Callable[[Any, int], None]] = {}
+    while True:
+        msg = mlog.recv_match(type=types, blocking=False)
+        if msg is None:
+            break
+
+        t = _safe_time_us(msg)
+        if t is None:
+            continue
+
+        msg_type = msg.get_type()
+        handler = handlers.get(msg_type)
+        if handler is None:
+            handler = handlers[msg_type] = make_handler(msg)
+        handler(msg, t)
+
+    frames: Dict[str, Any] = {name: buf.to_frame() for name, buf in bufs.items()}
+    frames["BAT"] = {pack: buf.to_frame() for pack, buf in packs.items()}
+    return frames
+
+
+def _time_to_seconds(df: pd.DataFrame) -> pd.DataFrame:
+    """Replace the raw TimeUS column with seconds (2 dp, float32) in one vectorized pass."""
+    if "TimeUS" not in df.columns:
+        return df
+    seconds = np.round(df["TimeUS"].to_numpy() * 1e-6, 2).astype(np.float32)
+    out = df.drop(columns="TimeUS")
+    out.insert(0, "Time (s)", seconds)
+    return out
+
+
+def _altitude_frame(raw: pd.DataFrame) -> pd.DataFrame:
+    """Drop GPS samples without altitude and convert cm to metres in one numpy pass."""
+    if "Alt" not in raw.columns:
+        return pd.DataFrame()
+    alt = raw["Alt"].to_numpy()
+    keep = ~np.isnan(alt)
+    return pd.DataFrame(
+        {
+            "Time (s)": raw["Time (s)"].to_numpy()[keep],
+            "Alt_m": alt[keep] / 100.0,
+        }
+    )
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast sample columns for plotting/export: floats to float32, PWM channels to uint16."""
+    cols: Dict[str, Any] = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if name == "Time (s)":
+            pass
+        elif name in RCOU_CHANNELS and values.dtype.kind in "iu":
+            values = values.astype(np.uint16, copy=False)
+        elif values.dtype.kind == "f":
+            values = values.astype(np.float32, copy=False)
+        cols[name] = values
+    return pd.DataFrame(cols)
+
+
+def format_errors(err: pd.DataFrame) -> List[str]:
+    """Render ERR samples (time, subsystem, error code) as display lines."""
+    if err.empty:
+        return []
+    subsys = err["Subsys"].astype(int)
+    ecode = err["ECode"].astype(int)
+    subsys_str = subsys.map(ERR_SUBSYS_CODES).fillna("Unknown Subsys " + subsys.astype(str))
+    ecode_str = ecode.map(ERR_ERROR_CODES).fillna("Unknown ECode " + ecode.astype(str))
+    return ("ERR at " + err["Time (s)"].astype(str) + "s: " + subsys_str + " - " + ecode_str).tolist()
+
+
+def format_events(ev: pd.DataFrame) -> List[str]:
+    """Render EV samples (time, event id) as display lines."""
+    if ev.empty:
+        return []
+    eid = ev["Id"].astype(int)
+    event_str = eid.map(EV_ID_MAP).fillna("Unknown Event ID " + eid.astype(str))
+    return ("EV at " + ev["Time (s)"].astype(str) + "s: " + event_str).tolist()
+
+
+def _build_result(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn per-message-type sample frames into the structures the UI renders."""
+    empty = pd.DataFrame()
+    frames = {name: _time_to_seconds(df) for name, df in raw.items() if name != "BAT"}
+
+    ev = frames.get("EV", empty)
     mode_data: List[Tuple[float, str]] = []
+    if not ev.empty:
+        mode_times = ev["Time (s)"][ev["Id"] == 28].to_numpy(np.float64)  # mode change marker
+        mode_data = [(t, EV_ID_MAP[28]) for t in np.round(mode_times, 2).tolist()]
+
+    battery_dfs = {pack: _compact(_time_to_seconds(bdf)) for pack, bdf in sorted(raw.get("BAT", {}).items())}
+
+    return {
+        # Raw ERR/EV samples; rendered to text on demand by format_errors/format_events
+        "err_df": frames.get("ERR", empty),
+        "ev_df": ev,
+        "modes": mode_data,
+        "altitude_df": _compact(_altitude_frame(frames.get("GPS", empty))),
+        "attitude_df": _compact(frames.get("ATT", empty)),
+        "esc_df": _compact(frames.get("ESC", empty)),
+        "vibe_df": _compact(frames.get("VIBE", empty)),
+        "rc_df": _compact(frames.get("RCIN", empty)),
+        "rcout_df": _compact(frames.get("RCOU", empty)),
+        "battery_dfs": battery_dfs,
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=LOG_CACHE_ENTRIES)
+def parse_log(file_key: str, _upload: BinaryIO) -> Dict[str, Any]:
+    """Parse an uploaded BIN log and return structured data for the app.
+
+    Cached on `file_key` (a digest of the log) only; the leading underscore keeps
+    Streamlit from re-hashing the full payload on every rerun.
+    """
+    # Temp file for pymavlink (DFReader needs a path it can mmap), copied in 1 MiB chunks
+    _upload.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".bin") as tf:
+        shutil.copyfileobj(_upload, tf, length=1 << 20)
+        temp_filename = tf.name
 
     try:
+        # .bin paths open as DFReader_binary, which mmaps and indexes the whole file;
+        # robust_parsing/notimestamps and read buffering only affect MAVLink telemetry
+        # readers, so no connection options are passed. The index stops at a corrupt
+        # record header, so a truncated index falls back to an unfiltered read.
         mlog = mavutil.mavlink_connection(temp_filename)
-        count = 0
-        while True:
-            msg = mlog.recv_match()
-            if msg is None:
-                break
-            count += 1
-
-            t = _safe_time_s(msg)
-            if t is None:
-                continue
-
-            msg_type = msg.get_type()
-
-            if msg_type == "ERR":
-                subsys = getattr(msg, "Subsys", -1)
-                ecode = getattr(msg, "ECode", -1)
-                subsys_str = ERR_SUBSYS_CODES.get(subsys, f"Unknown Subsys {subsys}")
-                ecode_str = ERR_ERROR_CODES.get(ecode, f"Unknown ECode {ecode}")
-                error_msgs.append(f"ERR at {t}s: {subsys_str} - {ecode_str}")
-
-            elif msg_type == "EV":
-                eid = getattr(msg, "Id", -1)
-                event_str = EV_ID_MAP.get(eid, f"Unknown Event ID {eid}")
-                event_msgs.append(f"EV at {t}s: {event_str}")
-                if eid == 28:  # mode change marker
-                    mode_data.append((t, event_str))
-
-            elif msg_type == "GPS":
-                alt_cm = getattr(msg, "Alt", None)
-                if alt_cm is not None:
-                    altitude_data.append({"Time (s)": t, "Alt_m": alt_cm / 100.0})
-
-            elif msg_type == "BAT":
-                pack = getattr(msg, "SNum", 0)  # battery index/serial number
-                entry = {
-                    "Time (s)": t,
-                    "Volt": getattr(msg, "Volt", None),
-                    "VoltR": getattr(msg, "VoltR", None),
-                    "Curr": getattr(msg, "Curr", None),
-                    "CurrTot": getattr(msg, "CurrTot", None),
-                    "Temp": getattr(msg, "Temp", None),
-                    "RemPct": getattr(msg, "RemPct", None),
-                    "SNum": pack,
-                }
-                battery_by_pack.setdefault(int(pack), []).append(entry)
-
-            elif msg_type == "ATT":
-                attitude_data.append(
-                    {
-                        "Time (s)": t,
-                        "DesRoll": getattr(msg, "DesRoll", None),
-                        "Roll": getattr(msg, "Roll", None),
-                    }
-                )
-
-            elif msg_type == "ESC":
-                esc_data.append({"Time (s)": t, "Temp": getattr(msg, "Temp", None)})
-
-            elif msg_type == "VIBE":
-                vibe_data.append(
-                    {
-                        "Time (s)": t,
-                        "VibeX": getattr(msg, "VibeX", None),
-                        "VibeY": getattr(msg, "VibeY", None),
-                        "VibeZ": getattr(msg, "VibeZ", None),
-                    }
-                )
-
-            elif msg_type == "RCIN":
-                rc_data.append(
-                    {
-                        "Time (s)": t,
-                        "C1": getattr(msg, "C1", None),
-                        "C2": getattr(msg, "C2", None),
-                        "C3": getattr(msg, "C3", None),
-                        "C4": getattr(msg, "C4", None),
-                    }
-                )
-
-            elif msg_type == "RCOU":
-                # Capture as many channels as present (1..16)
-                fields = {f"C{i}": getattr(msg, f"C{i}", None) for i in range(1, 17)}
-                fields["Time (s)"] = t
-                rcout_data.append(fields)
-
-        # Convert to DataFrames where useful
-        altitude_df = pd.DataFrame(altitude_data)
-        attitude_df = pd.DataFrame(attitude_data)
-        esc_df = pd.DataFrame(esc_data)
-        vibe_df = pd.DataFrame(vibe_data)
-        rc_df = pd.DataFrame(rc_data)
-        rcout_df = pd.DataFrame(rcout_data)
-        battery_dfs = {k: pd.DataFrame(v) for k, v in battery_by_pack.items()}
-
-        return {
-            "errors": error_msgs,
-            "events": event_msgs,
-            "modes": mode_data,
-            "altitude_df": altitude_df,
-            "attitude_df": attitude_df,
-            "esc_df": esc_df,
-            "vibe_df": vibe_df,
-            "rc_df": rc_df,
-            "rcout_df": rcout_df,
-            "battery_dfs": battery_dfs,
-        }
+        resynced = _index_truncated(mlog)
+        if resynced:
+            raw = _read_streamed(mlog, types=None)
+        else:
+            raw = _read_indexed(mlog)
+            if raw is None:
+                raw = _read_streamed(mlog)
+        result = _build_result(raw)
+        result["resynced"] = resynced
+        return result
 
     finally:
         if os.path.exists(temp_filename):
@@ -207,34 +512,106 @@ def parse_log(file_bytes: bytes) -> Dict[str, Any]:
                 pass
 
 
-def plot_chart(df: pd.DataFrame, title: str, ylabel: str, keys: List[str]):
-    if df is None or df.empty:
-        st.info(f"No data available for {title}")
-        return None
-    available = [k for k in keys if k in df.columns]
-    if not available:
-        st.info(f"No matching fields for {title}")
-        return None
-    plot_df = df[["Time (s)"] + available].dropna(how="all", subset=available)
-    if plot_df.empty:
-        st.info(f"No valid samples for {title}")
-        return None
-    fig, ax = plt.subplots(figsize=(10, 4))
-    for key in available:
-        ax.plot(plot_df["Time (s)"], plot_df[key], label=key, linewidth=0.8)
+def _decimate_minmax(x: np.ndarray, y: np.ndarray, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the min and max sample of each of `n_buckets` equal buckets, in time order.
+
+    Preserves the visible envelope of the trace while cutting the vertex count to
+    about two per bucket; series already that short are returned unchanged.
+    """
+    size = len(y) // n_buckets
+    if size < 2:
+        return x, y
+    used = size * n_buckets
+    buckets = y[:used].reshape(n_buckets, size).astype(np.float64)
+    nan = np.isnan(buckets)
+    lo = np.argmin(np.where(nan, np.inf, buckets), axis=1)
+    hi = np.argmax(np.where(nan, -np.inf, buckets), axis=1)
+    start = np.arange(n_buckets) * size
+    idx = np.column_stack((start + np.minimum(lo, hi), start + np.maximum(lo, hi))).ravel()
+    idx = np.concatenate((idx, np.arange(used, len(y))))
+    return x[idx], y[idx]
+
+
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a frame as UTF-8 CSV with Arrow's C++ writer."""
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def render_chart_png(plot_df: pd.DataFrame, title: str, ylabel: str, keys: List[str]) -> bytes:
+    """Draw one time-series chart and return it as PNG bytes.
+
+    Uses a standalone Figure (no pyplot state), so it is safe to call from worker threads.
+    """
+    fig = Figure(figsize=(10, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    # Two vertices (min/max) per output pixel column is all the rasterizer can show
+    n_buckets = int(fig.get_size_inches()[0] * CHART_DPI)
+    times = plot_df["Time (s)"].to_numpy()
+    for key in keys:
+        xs, ys = _decimate_minmax(times, plot_df[key].to_numpy(), n_buckets)
+        ax.plot(xs, ys, label=key, linewidth=0.8)
     ax.set_title(title)
     ax.set_xlabel("Flight Duration (s)")
     ax.set_ylabel(ylabel)
     ax.legend()
     ax.grid(True)
-    st.pyplot(fig)
+    png = BytesIO()
+    fig.savefig(png, format="png", dpi=CHART_DPI, bbox_inches="tight")
+    return png.getvalue()
+
+
+def _chart_frame(df: pd.DataFrame, title: str, keys: List[str]) -> Tuple[pd.DataFrame | None, str]:
+    """Select the columns to plot; returns (frame, "") or (None, why there is nothing to plot)."""
+    if df is None or df.empty:
+        return None, f"No data available for {title}"
+    available = [k for k in keys if k in df.columns]
+    if not available:
+        return None, f"No matching fields for {title}"
+    plot_df = df[["Time (s)"] + available].dropna(how="all", subset=available)
+    if plot_df.empty:
+        return None, f"No valid samples for {title}"
+    return plot_df, ""
+
+
+def _render_chart(plot_df: pd.DataFrame, title: str, ylabel: str) -> Dict[str, Any]:
+    keys = [c for c in plot_df.columns if c != "Time (s)"]
+    return {"title": title, "png": render_chart_png(plot_df, title, ylabel, keys), "csv": _csv_bytes(plot_df)}
+
+
+@st.cache_data(show_spinner=False, max_entries=LOG_CACHE_ENTRIES)
+def render_charts(file_key: str, _specs: Dict[str, Tuple[pd.DataFrame, str, str, List[str]]]) -> Dict[str, Dict[str, Any]]:
+    """Render every chart of one log to PNG + CSV bytes, keyed like `_specs`.
+
+    Cached on `file_key`, so reruns (e.g. toggling an expander) reuse the images; the
+    underscore keeps Streamlit from hashing the frames. Renders run on a thread pool,
+    as Agg releases the GIL while rasterizing.
+    """
+    charts: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for name, (df, title, ylabel, keys) in _specs.items():
+            plot_df, note = _chart_frame(df, title, keys)
+            if plot_df is None:
+                charts[name] = {"title": title, "note": note}
+            else:
+                charts[name] = pool.submit(_render_chart, plot_df, title, ylabel)
+    return {name: c.result() if isinstance(c, Future) else c for name, c in charts.items()}
+
+
+def plot_chart(chart: Dict[str, Any]) -> None:
+    if "note" in chart:
+        st.info(chart["note"])
+        return
+    title = chart["title"]
+    st.image(chart["png"], width="stretch")
     st.download_button(
         label=f"📥 Download {title} CSV",
-        data=plot_df.to_csv(index=False).encode("utf-8"),
+        data=chart["csv"],
         file_name=f"{title.replace(' ', '_').lower()}.csv",
         mime="text/csv",
     )
-    return plot_df
 
 
 # -----------------------------
@@ -251,55 +628,76 @@ if uploaded_file is None:
 st.success("File uploaded successfully!")
 
 # Parse with caching to avoid re-work on reruns
+file_key = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
 with st.spinner("Parsing log…"):
-    parsed = parse_log(uploaded_file.getbuffer().tobytes())
+    parsed = parse_log(file_key, uploaded_file)
+
+if parsed["resynced"]:
+    st.warning("This log contains a corrupt record that stopped pymavlink's index; "
+               "it was re-read message by message, so parsing was slower than usual.")
 
 # -----------------------------
 # Errors & events
 # -----------------------------
-if parsed["errors"]:
+if not parsed["err_df"].empty:
     with st.expander("❌ Error Messages", expanded=True):
-        for err in parsed["errors"]:
+        for err in format_errors(parsed["err_df"]):
             st.code(err)
 
-if parsed["events"]:
+if not parsed["ev_df"].empty:
     with st.expander("⚠️ System Events", expanded=True):
-        for ev in parsed["events"]:
+        for ev in format_events(parsed["ev_df"]):
             st.code(ev)
 
 # -----------------------------
 # Charts
 # -----------------------------
+# Auto-detect available RCOU channels
+rcout_cols = [c for c in parsed["rcout_df"].columns if c.startswith("C")]
+# Prefer common groupings; fallback to whatever is available
+preferred = [f"C{i}" for i in range(1, 13)]
+rcout_keys = [c for c in preferred if c in rcout_cols] or rcout_cols
+
+chart_specs = {
+    **{
+        f"battery_{pack}": (bdf, f"Battery {pack} Metrics", "Value", ["Volt", "Curr", "Temp", "RemPct"])
+        for pack, bdf in parsed["battery_dfs"].items()
+    },
+    "altitude": (parsed["altitude_df"], "GPS Altitude Over Time", "Altitude (m)", ["Alt_m"]),
+    "attitude": (parsed["attitude_df"], "Desired vs Actual Roll", "Degrees", ["DesRoll", "Roll"]),
+    "esc": (parsed["esc_df"], "ESC Temperature Over Time", "Temp (°C)", ["Temp"]),
+    "vibe": (parsed["vibe_df"], "Vibration Metrics", "Vibe", ["VibeX", "VibeY", "VibeZ"]),
+    "rc": (parsed["rc_df"], "RC Input (C1–C4)", "PWM", ["C1", "C2", "C3", "C4"]),
+    "rcout": (parsed["rcout_df"], "Motor Output (RCOU)", "PWM", rcout_keys),
+}
+with st.spinner("Rendering charts…"):
+    charts = render_charts(file_key, chart_specs)
+
 with st.expander("🪫 Battery Metrics"):
     if not parsed["battery_dfs"]:
         st.info("No battery messages found.")
     else:
-        for pack, bdf in sorted(parsed["battery_dfs"].items()):
+        for pack in parsed["battery_dfs"]:
             st.subheader(f"Battery {pack} Metrics")
-            plot_chart(bdf, f"Battery {pack} Metrics", "Value", ["Volt", "Curr", "Temp", "RemPct"])  # include RemPct if present
+            plot_chart(charts[f"battery_{pack}"])
 
 with st.expander("🛰️ GPS Altitude"):
-    plot_chart(parsed["altitude_df"], "GPS Altitude Over Time", "Altitude (m)", ["Alt_m"])  
+    plot_chart(charts["altitude"])
 
 with st.expander("🧭 Attitude (Roll)"):
-    plot_chart(parsed["attitude_df"], "Desired vs Actual Roll", "Degrees", ["DesRoll", "Roll"])  
+    plot_chart(charts["attitude"])
 
 with st.expander("🧊 ESC Temperature"):
-    plot_chart(parsed["esc_df"], "ESC Temperature Over Time", "Temp (°C)", ["Temp"])  
+    plot_chart(charts["esc"])
 
 with st.expander("🔧 Vibration Metrics"):
-    plot_chart(parsed["vibe_df"], "Vibration Metrics", "Vibe", ["VibeX", "VibeY", "VibeZ"])  
+    plot_chart(charts["vibe"])
 
 with st.expander("🎮 RC Inputs"):
-    plot_chart(parsed["rc_df"], "RC Input (C1–C4)", "PWM", ["C1", "C2", "C3", "C4"])  
+    plot_chart(charts["rc"])
 
 with st.expander("⚡ Motor Outputs"):
-    # Auto-detect available RCOU channels
-    rcout_cols = [c for c in parsed["rcout_df"].columns if c.startswith("C")]
-    # Prefer common groupings; fallback to whatever is available
-    preferred = [f"C{i}" for i in range(1, 13)]
-    keys = [c for c in preferred if c in rcout_cols] or rcout_cols
-    plot_chart(parsed["rcout_df"], "Motor Output (RCOU)", "PWM", keys)
+    plot_chart(charts["rcout"])
 
 # -----------------------------
 # Mode timeline (event markers)
@@ -322,22 +720,14 @@ with st.expander("📄 Export Summary"):
         pdf.ln(5)
 
         pdf.set_font("Arial", size=10)
-        # Errors
+        # Errors (one text block: a single multi_cell lays out all lines)
         pdf.cell(0, 8, txt="Error Messages", ln=True)
-        if parsed["errors"]:
-            for err in parsed["errors"]:
-                pdf.multi_cell(0, 6, txt=err)
-        else:
-            pdf.multi_cell(0, 6, txt="(none)")
+        pdf.multi_cell(0, 6, txt="\n".join(format_errors(parsed["err_df"])) or "(none)")
         pdf.ln(3)
 
         # Events
         pdf.cell(0, 8, txt="System Events", ln=True)
-        if parsed["events"]:
-            for ev in parsed["events"]:
-                pdf.multi_cell(0, 6, txt=ev)
-        else:
-            pdf.multi_cell(0, 6, txt="(none)")
+        pdf.multi_cell(0, 6, txt="\n".join(format_events(parsed["ev_df"])) or "(none)")
 
         # Emit as bytes (FPDF 1.x safe)
         pdf_bytes = pdf.output(dest="S").encode("latin-1")
@@ -349,7 +739,7 @@ with st.expander("📄 Export Summary"):
         )
 
 # Footer tip
-st.caption("Refactor notes: uses cached parsing, safer plotting, battery pack detection (SNum), and fixed PDF export.")
+st.caption("Refactor notes: uses cached parsing, safer plotting, battery pack detection (instance, else SNum), and fixed PDF export.")
 
 
          